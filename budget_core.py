@@ -0,0 +1,206 @@
+# Shared data layer for the budget tracker. Frontends pick a Repository
+# implementation and keep only their widgets; schema, caching, prettifying
+# and xlsx export live here so every fix/optimization is applied once.
+import re
+from io import BytesIO
+from typing import Protocol
+
+import pandas as pd
+import numpy as np
+import streamlit as st
+from openpyxl import Workbook
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+
+# ── Database connection ─────────────────────────────────────────────────────
+# Supabase's session pooler only allows ~15 client connections, so keep the
+# pool small and recycle stale connections instead of relying on the
+# SQLAlchemy defaults (size=5, overflow=10) which exhaust it under load.
+ENGINE = create_engine(
+    st.secrets["supabase"]["pooler"],  # Session-Pooler URL
+    pool_size=3,
+    max_overflow=2,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    pool_timeout=30,
+    # Batch multi-row inserts into a single round-trip (psycopg2)
+    executemany_mode="values_plus_batch",
+    # pgbouncer-style poolers break with server-side prepared statements
+    execution_options={"prepared_statement_cache_size": 0},
+)
+
+# ── Column definitions ──────────────────────────────────────────────────────
+RAW = [
+    "id", "date", "vendor", "description", "location", "recovery_type",
+    "charged_amount", "invoice", "chq_req", "out_of_pocket",
+]
+PRETTY = {
+    "date": "Date", "vendor": "Vendor", "description": "Description",
+    "location": "Location", "recovery_type": "Recovery Type",
+    "charged_amount": "Charged Amount", "reimbursed_amount": "Reimbursed Amount",
+    "invoice": "Invoice #", "chq_req": "CHQ REQ #",
+    "out_of_pocket": "Out of Pocket?",
+}
+DISPLAY_COLS  = [c for c in RAW + ["reimbursed_amount"] if c != "id"]
+DISPLAY_NAMES = [PRETTY[c] for c in DISPLAY_COLS]
+
+# ── Helpers ──────────────────────────────────────────────────────────────────
+_ZERO_WIDTH = re.compile(r"[\u200B-\u200D\uFEFF]")
+
+def _clean_cols(cols: pd.Index) -> pd.Index:
+    # Plain str ops beat four chained pandas string dispatches for ~10 labels
+    return pd.Index(
+        _ZERO_WIDTH.sub("", c).strip().lower().replace(" ", "_") for c in cols
+    )
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_data() -> pd.DataFrame:
+    """Load & normalise the full expenses table, then compute reimbursements.
+
+    Cached for 5 min so reruns skip the Supabase round-trip; save_row /
+    delete_row clear the cache so mutations show up immediately. Database
+    errors propagate (st.cache_data never caches a raise) — SupabaseRepo.load
+    handles them, so a transient failure is never cached for the TTL.
+    """
+    df = pd.read_sql(
+        "SELECT id, date, vendor, description, location, recovery_type,"
+        "charged_amount, invoice, chq_req, out_of_pocket "
+        "FROM expenses ORDER BY id",
+        ENGINE, parse_dates=["date"]
+    )
+
+    df.columns = _clean_cols(df.columns)
+    # One reindex fills any missing RAW column with NA and fixes the order
+    # (out_of_pocket NAs become False in the coercion below)
+    df = df.reindex(columns=RAW)
+
+    # dtype coercion
+    df["out_of_pocket"]  = df["out_of_pocket"].fillna(False).astype(bool)
+    df["charged_amount"] = pd.to_numeric(df["charged_amount"], errors="coerce").fillna(0.0)
+
+    # Shrink the frame: float32 amounts, smallest unsigned id, categorical
+    # low-cardinality text — roughly halves memory for the cached copy.
+    df["charged_amount"] = pd.to_numeric(df["charged_amount"], downcast="float")
+    df["id"]             = pd.to_numeric(df["id"], downcast="unsigned")
+    for col in ("vendor", "location", "recovery_type"):
+        df[col] = df[col].astype("category")
+
+    # **Recompute reimbursed_amount on-the-fly** (on raw ndarrays, skipping
+    # the Series wrap/align path):
+    oop = df["out_of_pocket"].to_numpy()
+    amt = df["charged_amount"].to_numpy()
+    df["reimbursed_amount"] = np.where(oop, 0.0, amt)
+
+    return df[RAW + ["reimbursed_amount"]]
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_summary() -> tuple[float, float]:
+    """Aggregate spend server-side: (out-of-pocket, unreimbursed) totals.
+
+    Like load_data, database errors propagate so they are never cached;
+    SupabaseRepo.summary supplies the fallback.
+    """
+    sql = text("""
+        SELECT
+            COALESCE(SUM(charged_amount) FILTER (WHERE out_of_pocket), 0),
+            COALESCE(SUM(charged_amount - reimbursed_amount)
+                     FILTER (WHERE NOT out_of_pocket), 0)
+        FROM expenses
+    """)
+    with ENGINE.connect() as conn:
+        spent_oop, spent_diff = conn.execute(sql).one()
+    return float(spent_oop), float(spent_diff)
+
+INSERT_SQL = text("""
+    INSERT INTO expenses
+    (date, vendor, description, location, recovery_type,
+     charged_amount, reimbursed_amount, invoice, chq_req, out_of_pocket)
+    VALUES
+    (:date, :vendor, :description, :location, :recovery_type,
+     :charged_amount, :reimbursed_amount, :invoice, :chq_req, :out_of_pocket)
+""")
+
+def save_rows(rows: list[dict]) -> None:
+    """Insert many expense rows in one executemany round-trip."""
+    with ENGINE.begin() as conn:
+        conn.execute(INSERT_SQL, rows)
+    load_data.clear()
+    load_summary.clear()
+
+def save_row(data: dict) -> None:
+    save_rows([data])
+
+def delete_row(rid: int) -> None:
+    with ENGINE.begin() as conn:
+        conn.execute(text("DELETE FROM expenses WHERE id = :rid"), {"rid": rid})
+    load_data.clear()
+    load_summary.clear()
+
+# ── Repository abstraction ──────────────────────────────────────────────────
+class Repository(Protocol):
+    """Storage backend contract shared by all frontends."""
+    def load(self) -> pd.DataFrame: ...
+    def summary(self) -> tuple[float, float]: ...
+    def save(self, row: dict) -> None: ...
+    def save_many(self, rows: list[dict]) -> None: ...
+    def delete(self, rid: int) -> None: ...
+
+class SupabaseRepo:
+    """Postgres/Supabase-backed repository.
+
+    Methods delegate to the cached module-level functions so st.cache_data
+    never has to hash the repo instance itself. Error fallbacks live here,
+    outside the cache, so only successful loads are cached.
+    """
+    def load(self) -> pd.DataFrame:
+        try:
+            return load_data()
+        except SQLAlchemyError as e:
+            st.error(f"🚫 Database error: {e}")
+            return pd.DataFrame(columns=RAW + ["reimbursed_amount"])
+
+    def summary(self) -> tuple[float, float]:
+        try:
+            return load_summary()
+        except SQLAlchemyError as e:
+            st.error(f"🚫 Database error: {e}")
+            return 0.0, 0.0
+
+    def save(self, row: dict) -> None:
+        save_row(row)
+
+    def save_many(self, rows: list[dict]) -> None:
+        save_rows(rows)
+
+    def delete(self, rid: int) -> None:
+        delete_row(rid)
+
+# ── Rendering helpers ────────────────────────────────────────────────────────
+def style_oop(disp: pd.DataFrame) -> pd.DataFrame:
+    """Colour whole rows red where Out of Pocket? is set (one np.where, no per-row UDF)."""
+    styles = np.where(disp["Out of Pocket?"].to_numpy()[:, None], "color:red", "")
+    # np.where leaves shape (n, 1); broadcast across the columns because the
+    # DataFrame constructor won't
+    return pd.DataFrame(
+        np.broadcast_to(styles, disp.shape), index=disp.index, columns=disp.columns
+    )
+
+def prettify(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.loc[:, DISPLAY_COLS]
+    out.columns = DISPLAY_NAMES
+    return out
+
+@st.cache_data(show_spinner=False)
+def to_xlsx(df: pd.DataFrame) -> bytes:
+    # Cached by DataFrame content hash: the download buttons evaluate their
+    # data= argument on every rerun, so repeat reruns reuse the same bytes.
+    # Write-only mode streams rows out instead of keeping every Cell object
+    # live, so memory stays ~constant regardless of table size.
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Expenses")
+    ws.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        ws.append(row)
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()